@@ -2,23 +2,69 @@
 import streamlit as st
 st.set_page_config(page_title="Shylock — Private Loan Servicing", page_icon="💸", layout="centered")
 
-from datetime import date, datetime as _dt
-import base64, secrets
+from collections.abc import Mapping
+from datetime import date
+from io import BytesIO
+import base64, re, secrets
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 from shylock_ledger import (
-    compute_ledger, make_display, render_ledger, build_pdf_from_ledger, parse_us_date
+    compute_ledger, make_display, render_ledger, build_pdf_from_ledger, parse_us_date, parse_us_date_series
 )
 
 # ---------------- Supabase ----------------
+@st.cache_resource
+def _http_transport():
+    # one keep-alive pool per server process; supabase-py rebuilds its PostgREST
+    # session on every auth event, so without this each rebuild paid a fresh TLS handshake
+    import httpx
+    return httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40, keepalive_expiry=60.0),
+    )
+
+def _pooled_postgrest_client(rest_url, headers, schema, timeout):
+    from postgrest import SyncPostgrestClient
+    from postgrest.utils import SyncClient
+
+    class _PooledPostgrestClient(SyncPostgrestClient):
+        def create_session(self, base_url, headers, timeout, verify=True):
+            return SyncClient(base_url=base_url, headers=headers, timeout=timeout,
+                              follow_redirects=True, transport=_http_transport())
+
+    return _PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout)
+
+def get_supabase(url: str, key: str):
+    # one client per browser session, reused across its reruns. Sign-in state lives on the client
+    # (its auth storage, and the JWT it sends to PostgREST), so a process-wide client would share
+    # one user's session with everyone; and create_client's default ClientOptions carries a single
+    # SyncMemoryStorage shared by every client it builds, so each session gets its own storage.
+    # Only the HTTP transport underneath is process-wide.
+    if "_supabase_client" not in st.session_state:
+        from supabase import ClientOptions, create_client
+        from gotrue import SyncMemoryStorage
+        client = create_client(url, key, ClientOptions(storage=SyncMemoryStorage()))
+        # supabase-py rebuilds the PostgREST client on auth events; route every rebuild through the pool
+        client._init_postgrest_client = _pooled_postgrest_client
+        st.session_state["_supabase_client"] = client
+    return st.session_state["_supabase_client"]
+
+PAYMENTS_BUCKET = None
 try:
-    from supabase import create_client, Client
+    from supabase import Client
+    from gotrue.errors import AuthError, AuthRetryableError
+    from gotrue.types import Session
+    from postgrest.exceptions import APIError
+    import httpx
     _sb = st.secrets.get("supabase", {})
     SUPABASE_URL = _sb.get("url"); SUPABASE_ANON_KEY = _sb.get("anon_key")
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise RuntimeError("Missing supabase.url or supabase.anon_key in Streamlit secrets.")
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    supabase: Client = get_supabase(SUPABASE_URL, SUPABASE_ANON_KEY)
+    # optional Storage bucket holding one parquet file of payments per loan (see save_payments_blob)
+    PAYMENTS_BUCKET = _sb.get("payments_bucket")
     SUPABASE_OK = True
 except Exception as e:
     SUPABASE_OK = False; supabase = None
@@ -39,18 +85,21 @@ def _inject_global_css():
         unsafe_allow_html=True,
     )
 
-def render_header(
+@st.cache_resource(show_spinner=False)
+def _logo_b64(logo_path: str) -> str:
+    # read + encode the logo once per process, not on every header render
+    p = Path(logo_path)
+    if not p.exists(): return ""
+    try: return base64.b64encode(p.read_bytes()).decode("utf-8")
+    except Exception: return ""
+
+def _header_html(
     logo_path: str = "ShylockLogo.png",
     tagline: str = "The humane way to track private personal loans.",
     shylock_color: str = "#00B050", online_color: str = "#E32636",
-):
-    logo_b64 = ""
-    p = Path(logo_path)
-    if p.exists():
-        try: logo_b64 = base64.b64encode(p.read_bytes()).decode("utf-8")
-        except Exception: logo_b64 = ""
-    st.markdown(
-        f"""
+) -> str:
+    logo_b64 = _logo_b64(logo_path)
+    return f"""
 <style>
 .shylock-header {{display:flex;align-items:center;justify-content:space-between;gap:1rem;width:100%;
   padding:.5rem 0 .75rem;border-bottom:1px solid rgba(0,0,0,.07);flex-wrap:wrap;}}
@@ -74,9 +123,10 @@ def render_header(
   </div>
   <div class="shylock-tagline">{tagline}</div>
 </div>
-""",
-        unsafe_allow_html=True,
-    )
+"""
+
+def render_header(**kwargs):
+    st.markdown(_header_html(**kwargs), unsafe_allow_html=True)
 
 # ---------------- Auth helpers ----------------
 def get_session():
@@ -84,31 +134,56 @@ def get_session():
     try: return supabase.auth.get_session()
     except Exception: return None
 
-def ensure_session_in_state():
+@st.cache_resource(ttl=60, show_spinner=False)
+def _resolve_session(access_token: str):
+    # keyed by the raw JWT, so repeats of the same redirect skip the auth round-trip; get_user
+    # only validates the token and leaves the client's auth state untouched (the result is cached across sessions)
+    resp = supabase.auth.get_user(access_token)
+    return resp.user if resp else None
+
+def ensure_session_in_state(access_token: str | None = None, refresh_token: str | None = None,
+                            expires_in: int = 3600):
     if not SUPABASE_OK: return
     if "session" not in st.session_state:
+        if access_token and refresh_token:
+            user = _resolve_session(access_token)
+            if user:
+                st.session_state["session"] = Session(access_token=access_token, refresh_token=refresh_token,
+                                                      expires_in=expires_in, token_type="bearer", user=user)
+                return
         sess = get_session()
         if sess and getattr(sess, "session", None):
             st.session_state["session"] = sess.session
+    # banner text, resolved once per session rather than on every rerun
+    user = getattr(st.session_state["session"], "user", None) if "session" in st.session_state else None
+    if user and "_user_display" not in st.session_state:
+        st.session_state["_user_display"] = user.email or user.id
 
 def sign_out():
     if not SUPABASE_OK: return
     try:
         supabase.auth.sign_out()
+        _resolve_session.clear()
         for k in list(st.session_state.keys()):
             del st.session_state[k]
         st.success("✅ Signed out")
     except Exception as e:
         st.error(f"Sign out error: {e}")
 
-def qp_get(name, default=None):
-    return st.query_params.get(name, default)
+# params Supabase appends to an auth redirect URL
+_AUTH_REDIRECT_PARAMS = ("access_token", "refresh_token", "expires_in", "expires_at", "token_type", "type")
+_JWT_SHAPE_RE = re.compile(r"^[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+$")
+_AUTH_MAX_ATTEMPTS = 3
 
-def role_from_query() -> str | None:
-    return st.session_state.get("role") or qp_get("role")
+def request_sign_out():
+    # button callback: runs before the click's rerun, so main() signs out before rendering
+    st.session_state["_pending_signout"] = True
 
-def borrower_token_from_query() -> str | None:
-    return qp_get("token")
+def parse_query(qp: Mapping) -> tuple[str | None, str | None]:
+    # (borrower token, role) from the dict(st.query_params) snapshot main() takes once per run;
+    # a role picked on the landing page wins over the URL
+    role = st.session_state["role"] if "role" in st.session_state else None
+    return qp.get("token"), role or qp.get("role")
 
 def set_role_in_url(role: str):
     st.session_state["role"] = role
@@ -116,63 +191,160 @@ def set_role_in_url(role: str):
     except Exception: pass
 
 # ---------------- DB access ----------------
-def loans_for_lender(user_id: str):
+# loan pickers only need these; the full row is fetched once per selection by get_loan()
+_LOAN_LIST_COLS = "id,loan_name,name,borrower_name,created_at"
+# what the read-only statement renders (ledger terms + PDF header)
+_LOAN_VIEW_COLS = ("id,loan_name,name,borrower_name,lender_name,principal,origination_date,annual_rate,"
+                   "late_fee_type,late_fee_amount,late_fee_days,penalty_interest_rate")
+_LOAN_PAGE = 200
+
+@st.cache_data(ttl=60, show_spinner=False)
+def loans_for_lender(user_id: str, limit: int = _LOAN_PAGE):
     try:
-        return supabase.table("loans").select("*").eq("lender_id", user_id).order("created_at").execute().data or []
+        return (supabase.table("loans").select(_LOAN_LIST_COLS).eq("lender_id", user_id)
+                .order("created_at").range(0, limit - 1).execute().data or [])
     except Exception:
         return []
 
+@st.cache_data(ttl=300, show_spinner=False)
+def get_loan(loan_id: str) -> dict | None:
+    try:
+        return supabase.table("loans").select("*").eq("id", loan_id).single().execute().data
+    except Exception:
+        return None
+
+@st.cache_data(ttl=60, show_spinner=False)
 def loans_for_borrower_by_token(token: str):
     if not token: return []
     try:
-        return supabase.table("loans").select("*").eq("borrower_token", token).limit(1).execute().data or []
+        return supabase.table("loans").select(_LOAN_VIEW_COLS).eq("borrower_token", token).limit(1).execute().data or []
     except Exception:
         return []
 
 def loans_for_borrower_signed_in(user_id: str):
     try:
-        supabase.table("loan_borrowers").select("loan_id").limit(1).execute()
-        lb = supabase.table("loan_borrowers").select("loan_id").eq("user_id", user_id).execute().data or []
-        ids = [r["loan_id"] for r in lb]
-        if not ids: return []
-        return supabase.table("loans").select("*").in_("id", ids).order("created_at").execute().data or []
+        # one round trip: inner-join loan_borrowers via PostgREST resource embedding
+        return (supabase.table("loans").select(f"{_LOAN_LIST_COLS},loan_borrowers!inner(user_id)")
+                .eq("loan_borrowers.user_id", user_id).order("created_at")
+                .range(0, _LOAN_PAGE - 1).execute().data or [])
     except Exception:
         return []
 
+@st.cache_data(ttl=60, show_spinner=False)
 def payments_for_loan(loan_id: str) -> pd.DataFrame:
+    if PAYMENTS_BUCKET:
+        blob = load_payments_blob(loan_id)
+        if blob is not None: return blob
     try:
-        rows = supabase.table("payments").select("*").eq("loan_id", loan_id).order("payment_date").execute().data or []
+        # ordered by payments_loan_date_idx, which also covers amount (index-only scan)
+        rows = supabase.table("payments").select("payment_date,amount").eq("loan_id", loan_id).order("payment_date").execute().data or []
     except Exception:
         rows = []
     if not rows:
         return pd.DataFrame(columns=["payment_date", "amount"])
-    df = pd.DataFrame(rows)
-    df["payment_date"] = pd.to_datetime(df["payment_date"], errors="coerce").dt.date
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-    return df[["payment_date", "amount"]].dropna()
+    # build just the two typed columns; payment_date stays datetime64 for the ledger
+    df = pd.DataFrame({
+        "payment_date": pd.to_datetime([r.get("payment_date") for r in rows], errors="coerce"),
+        "amount": pd.to_numeric([r.get("amount") for r in rows], errors="coerce"),
+    })
+    return df.dropna()
+
+# With supabase.payments_bucket set, a loan's payments live in <bucket>/<loan_id>.parquet:
+# one GET/PUT per read/write instead of N rows. Loans without a blob yet read the payments table.
+def load_payments_blob(loan_id: str) -> pd.DataFrame | None:
+    try:
+        data = supabase.storage.from_(PAYMENTS_BUCKET).download(f"{loan_id}.parquet")
+    except Exception:
+        return None
+    return pd.read_parquet(BytesIO(data), columns=["payment_date", "amount"])
+
+def save_payments_blob(loan_id: str, df: pd.DataFrame):
+    buf = BytesIO(); df[["payment_date", "amount"]].to_parquet(buf, index=False)
+    supabase.storage.from_(PAYMENTS_BUCKET).upload(
+        f"{loan_id}.parquet", buf.getvalue(), {"content-type": "application/octet-stream", "x-upsert": "true"})
+
+def loan_origination_date(loan: dict) -> date:
+    # origination_date is a Postgres date (YYYY-MM-DD); no need for pd.to_datetime on a scalar
+    v = loan.get("origination_date")
+    return date.fromisoformat(str(v)[:10]) if v else date.today()
+
+def _clear_loan_caches():
+    get_loan.clear(); loans_for_lender.clear(); loans_for_borrower_by_token.clear()
 
 def upsert_loan(loan: dict):
-    return supabase.table("loans").upsert(loan, on_conflict="id").execute()
+    res = supabase.table("loans").upsert(loan, on_conflict="id").execute()
+    _clear_loan_caches()
+    return res
 
 def delete_loan(loan_id: str):
-    return supabase.table("loans").delete().eq("id", loan_id).execute()
+    res = supabase.table("loans").delete().eq("id", loan_id).execute()
+    _clear_loan_caches()
+    return res
 
-def replace_payments(loan_id: str, df: pd.DataFrame):
-    supabase.table("payments").delete().eq("loan_id", loan_id).execute()
-    if df is None or df.empty: return
-    payload = []
-    for _, r in df.iterrows():
-        try:
-            dt = pd.to_datetime(r["payment_date"]).date().isoformat()
-            amt = float(r["amount"])
-            if amt <= 0: continue
-            payload.append({"loan_id": loan_id, "payment_date": dt, "amount": amt})
-        except Exception:
-            continue
-    if payload:
-        supabase.table("payments").insert(payload).execute()
+_INSERT_BATCH = 500  # keeps each PostgREST request body bounded for large CSV imports
+_RPC_MISSING_CODES = ("PGRST202", "42883")  # PostgREST / Postgres "function does not exist"
+
+def replace_payments(loan_id: str, df: pd.DataFrame) -> pd.DataFrame:
+    # returns the rows written, shaped like payments_for_loan(), so callers can skip a re-fetch
+    if df is None or df.empty:
+        written = pd.DataFrame(columns=["payment_date", "amount"])
+    else:
+        dates = pd.to_datetime(df["payment_date"], errors="coerce").dt.normalize()
+        amts = pd.to_numeric(df["amount"], errors="coerce")
+        keep = dates.notna() & np.isfinite(amts) & (amts > 0)
+        written = (pd.DataFrame({"payment_date": dates[keep], "amount": amts[keep].astype(float)})
+                     .sort_values("payment_date", kind="stable").reset_index(drop=True))
+    rows = ([{"payment_date": d, "amount": a}
+             for d, a in zip(written["payment_date"].dt.strftime("%Y-%m-%d").tolist(), written["amount"].tolist())]
+            if not written.empty else [])
+    if PAYMENTS_BUCKET:
+        save_payments_blob(loan_id, written); payments_for_loan.clear()
+        return written
+    try:
+        # one round trip, delete + insert in a single transaction (public.replace_payments in migrations.sql)
+        supabase.rpc("replace_payments", {"p_loan_id": loan_id, "p_rows": rows}).execute()
+    except APIError as e:
+        # only a database without the function yet falls back (delete, then insert in bounded
+        # batches, not atomic); permission/payload/timeout errors must not double- or half-write
+        if e.code not in _RPC_MISSING_CODES:
+            raise
+        supabase.table("payments").delete().eq("loan_id", loan_id).execute()
+        payload = [{"loan_id": loan_id, **r} for r in rows]
+        for i in range(0, len(payload), _INSERT_BATCH):
+            supabase.table("payments").insert(payload[i:i + _INSERT_BATCH]).execute()
+    finally:
+        payments_for_loan.clear()
+    return written
+
+def append_payment(loan_id: str, row: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    # Add Payment writes only the new row (replace_payments stays for CSV imports);
+    # returns current + row so the caller can skip a re-fetch
+    merged = row if current.empty else pd.concat([current, row], ignore_index=True)
+    merged = merged.sort_values("payment_date", kind="stable").reset_index(drop=True)  # back-dated rows slot in
+    if PAYMENTS_BUCKET:
+        return replace_payments(loan_id, merged)
+    dt, amt = row["payment_date"].iat[0], row["amount"].iat[0]
+    supabase.table("payments").insert({"loan_id": loan_id, "payment_date": f"{dt:%Y-%m-%d}", "amount": float(amt)}).execute()
+    payments_for_loan.clear()
+    return merged
 
 # ---------------- CSV clean ----------------
+_PAREN_RE = re.compile(r"^\((.*)\)$")   # (12.50) -> -12.50
+_AMT_STRIP = str.maketrans("", "", ",$\u00A0")  # literal chars: one C-level translate pass
+
+def _parse_payment_dates(col: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col.dt.normalize()
+    # ISO dates (what Supabase hands back) parse on the fast fixed-format path, then MM/DD/YYYY; anything else falls back
+    d = pd.to_datetime(col, format="%Y-%m-%d", errors="coerce")
+    miss = d.isna() & col.notna()
+    if miss.any():
+        d[miss] = parse_us_date_series(col[miss])
+        miss = d.isna() & col.notna()
+    if miss.any():
+        d[miss] = pd.to_datetime(col[miss], errors="coerce")
+    return d.dt.normalize()
+
 def clean_payments_df(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return pd.DataFrame(columns=["payment_date", "amount"])
@@ -182,20 +354,23 @@ def clean_payments_df(df: pd.DataFrame) -> pd.DataFrame:
         out = out.rename(columns={"date": "payment_date"})
     if "amount" not in out.columns:
         raise ValueError("Missing 'Amount' column")
-    out["payment_date"] = pd.to_datetime(out["payment_date"], errors="coerce").dt.date
-    amt = out["amount"].astype(str).str.strip()
-    amt = (amt.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
-               .str.replace(",", "", regex=False)
-               .str.replace("$", "", regex=False)
-               .str.replace("\u00A0", "", regex=False))
-    out["amount"] = pd.to_numeric(amt, errors="coerce")
+    out["payment_date"] = _parse_payment_dates(out["payment_date"])
+    if not pd.api.types.is_numeric_dtype(out["amount"]):
+        amt = out["amount"].astype(str).str.strip()
+        out["amount"] = amt.str.replace(_PAREN_RE, r"-\1", regex=True).str.translate(_AMT_STRIP)
+    out["amount"] = pd.to_numeric(out["amount"], errors="coerce").astype("float64")
     out = out.dropna(subset=["payment_date", "amount"]).reset_index(drop=True)
     out = out[out["amount"] > 0]
     return out[["payment_date", "amount"]]
 
 # ---------------- Views ----------------
+@st.cache_data(ttl=3600, show_spinner=False)
+def _landing_static() -> str:
+    # the header markup (CSS + inlined logo) never changes between reruns; build the blob once
+    return _header_html()
+
 def landing():
-    render_header()
+    st.markdown(_landing_static(), unsafe_allow_html=True)
     st.title("Welcome")
     st.write("Track irregular payments, allocate interest/fees/principal correctly, and export clean statements.")
     c1, c2 = st.columns(2)
@@ -261,8 +436,11 @@ def borrower_view_signed_in(user_id: str):
     if not rows:
         st.info("No loans are shared with this account."); return
     names = [f"{(r.get('loan_name') or r.get('name') or 'Loan')} — {r.get('borrower_name','(Borrower?)')}" for r in rows]
-    idx = st.selectbox("Select loan", range(len(rows)), format_func=lambda i: names[i])
-    _common_loan_view(rows[idx], read_only=True)
+    idx = st.selectbox("Select loan", range(len(rows)), format_func=names.__getitem__)
+    loan = get_loan(rows[idx]["id"])
+    if not loan:
+        st.error("Could not load this loan."); return
+    _common_loan_view(loan, read_only=True)
 
 def lender_view(user_id: str):
     render_header()
@@ -276,7 +454,8 @@ def lender_view(user_id: str):
         company_name = "Your Company"
     st.info(f"🏢 Managing loans for **{company_name}**")
 
-    loans = loans_for_lender(user_id)
+    limit = st.session_state["_loan_limit"] if "_loan_limit" in st.session_state else _LOAN_PAGE
+    loans = loans_for_lender(user_id, limit)
 
     a, b, c = st.columns([1.5,1,1])
     with a:
@@ -293,30 +472,35 @@ def lender_view(user_id: str):
             except Exception as e:
                 st.error(f"Create loan failed: {e}")
     with b:
-        if st.button("🔄 Refresh"): st.rerun()
+        if st.button("🔄 Refresh"): _clear_loan_caches(); payments_for_loan.clear(); st.rerun()
     with c:
-        if st.button("🚪 Sign out"): sign_out(); st.rerun()
+        st.button("🚪 Sign out", on_click=request_sign_out)
 
     if not loans:
         st.info("No loans yet. Click **New Loan** to create one."); return
 
     show_ids = st.checkbox("Show loan IDs", value=False)
-    sel = st.selectbox(
-        "Select Loan",
-        options=range(len(loans)),
-        format_func=lambda i: f"{(loans[i].get('loan_name') or loans[i].get('name') or 'Loan')} — {loans[i].get('borrower_name','(Borrower?)')}" + (f" — {loans[i]['id'][:8]}" if show_ids else "")
-    )
-    loan = loans[sel]
+    labels = [f"{(l.get('loan_name') or l.get('name') or 'Loan')} — {l.get('borrower_name','(Borrower?)')}" + (f" — {l['id'][:8]}" if show_ids else "")
+              for l in loans]
+    sel = st.selectbox("Select Loan", options=range(len(loans)), format_func=labels.__getitem__)
+    if len(loans) == limit and st.button("Load more loans"):
+        st.session_state["_loan_limit"] = limit + _LOAN_PAGE; st.rerun()
+    loan = get_loan(loans[sel]["id"])
+    if not loan:
+        st.error("Could not load this loan. Try **Refresh**."); return
 
     # -------- sidebar (edit) --------
-    with st.sidebar:
+    # Term edits live in a form so typing doesn't rerun the script (and re-query
+    # Supabase) per keystroke; one rerun fires when Save is pressed.
+    with st.sidebar.form("loan_form"):
         st.header("💰 Loan Terms")
         name = st.text_input("Loan Name", value=(loan.get("loan_name") or loan.get("name","")))
         borrower_name = st.text_input("Borrower Name", value=loan.get("borrower_name",""))
         principal = st.number_input("Original Principal ($)", min_value=0.0, value=float(loan.get("principal") or 0.0), step=1000.0, format="%.2f")
 
-        orig_str = _dt.strftime(pd.to_datetime(loan.get("origination_date")).to_pydatetime(), "%m/%d/%Y") if loan.get("origination_date") else ""
-        origination_date_val = parse_us_date(st.text_input("Origination Date (MM/DD/YYYY)", value=orig_str)) or (pd.to_datetime(loan.get("origination_date")).date() if loan.get("origination_date") else date.today())
+        orig_date = loan_origination_date(loan)
+        orig_str = orig_date.strftime("%m/%d/%Y") if loan.get("origination_date") else ""
+        origination_date_val = parse_us_date(st.text_input("Origination Date (MM/DD/YYYY)", value=orig_str)) or orig_date
 
         annual_rate_pct = st.number_input("Interest Rate (APR %)", min_value=0.0, value=float(loan.get("annual_rate") or 0.0), step=0.1, format="%.3f")
         term_years = st.number_input("Loan Term (years)", min_value=1, value=int(loan.get("term_years") or 30), step=1)
@@ -326,30 +510,29 @@ def lender_view(user_id: str):
         late_fee_amount = st.number_input("Late Fee Amount ($ or % of cycle interest)", min_value=0.0, value=float(loan.get("late_fee_amount") or 0.0), step=1.0, format="%.2f")
         grace_days = st.number_input("Grace Period (days)", min_value=0, value=int(loan.get("late_fee_days") or 4), step=1)
 
+        if st.form_submit_button("💾 Save Loan", use_container_width=True):
+            loan.update({
+                "loan_name": name, "borrower_name": borrower_name, "principal": principal,
+                "origination_date": origination_date_val.isoformat(),
+                "annual_rate": annual_rate_pct, "term_years": int(term_years),
+                "late_fee_type": late_fee_type, "late_fee_amount": late_fee_amount,
+                "late_fee_days": int(grace_days),
+            })
+            try: upsert_loan(loan); st.success("Saved."); st.rerun()
+            except Exception as e: st.error(f"Save failed: {e}")
+
+    with st.sidebar:
         with st.expander("Borrower link (read-only)", expanded=False):
             st.code(f"?role=borrower&token={loan.get('borrower_token')}", language="text")
             if st.button("Generate New Borrower Token"):
                 loan["borrower_token"] = secrets.token_urlsafe(32); upsert_loan(loan); st.success("New borrower token generated.")
 
         st.markdown("### Actions")
-        cA, cB = st.columns(2)
-        with cA:
-            if st.button("💾 Save Loan", use_container_width=True):
-                loan.update({
-                    "loan_name": name, "borrower_name": borrower_name, "principal": principal,
-                    "origination_date": origination_date_val.isoformat(),
-                    "annual_rate": annual_rate_pct, "term_years": int(term_years),
-                    "late_fee_type": late_fee_type, "late_fee_amount": late_fee_amount,
-                    "late_fee_days": int(grace_days),
-                })
-                try: upsert_loan(loan); st.success("Saved."); st.rerun()
-                except Exception as e: st.error(f"Save failed: {e}")
-        with cB:
-            if st.button("🗑️ Delete Loan", use_container_width=True):
-                try: delete_loan(loan["id"]); st.warning("Loan deleted."); st.rerun()
-                except Exception as e: st.error(f"Delete failed: {e}")
-
-    # Effective values (compute immediately without requiring Save)
+        if st.button("🗑️ Delete Loan", use_container_width=True):
+            try: delete_loan(loan["id"]); st.warning("Loan deleted."); st.rerun()
+            except Exception as e: st.error(f"Delete failed: {e}")
+
+    # Effective values (the last submitted form values)
     loan_effective = loan.copy()
     loan_effective.update({
         "loan_name": name, "borrower_name": borrower_name, "principal": principal,
@@ -362,6 +545,11 @@ def lender_view(user_id: str):
     _common_loan_view(loan_effective, read_only=False)
 
 # ---------------- Shared view ----------------
+@st.cache_data(show_spinner=False, max_entries=16)
+def _ledger_csv_bytes(ledger: pd.DataFrame) -> bytes:
+    # keyed on the ledger's content hash: reruns with an unchanged ledger skip to_csv
+    return ledger.to_csv(index=False).encode("utf-8")
+
 def _common_loan_view(loan_row: dict, read_only: bool):
     loan_id = loan_row["id"]
     payments_df = payments_for_loan(loan_id)
@@ -373,7 +561,7 @@ def _common_loan_view(loan_row: dict, read_only: bool):
         uploaded = st.file_uploader("Upload payments CSV (optional)", type=["csv"], disabled=read_only)
         if uploaded is not None and not read_only:
             try:
-                tmp = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+                tmp = pd.read_csv(uploaded, engine="pyarrow", dtype_backend="pyarrow")
                 cols_lower = [c.lower().strip() for c in tmp.columns]
                 if "date" in cols_lower and "amount" in cols_lower:
                     tmp = tmp.rename(columns={tmp.columns[cols_lower.index("date")]: "payment_date",
@@ -384,8 +572,8 @@ def _common_loan_view(loan_row: dict, read_only: bool):
                 else:
                     st.error("CSV must include columns: Date, Amount (or Payment Date, Amount)."); tmp = None
                 if tmp is not None:
-                    cleaned = clean_payments_df(tmp); replace_payments(loan_id, cleaned)
-                    st.success(f"Imported {len(cleaned)} payments."); payments_df = payments_for_loan(loan_id)
+                    cleaned = clean_payments_df(tmp); payments_df = replace_payments(loan_id, cleaned)
+                    st.success(f"Imported {len(cleaned)} payments.")
             except Exception as e:
                 st.error(f"CSV parse failed: {e}")
     else:
@@ -393,7 +581,7 @@ def _common_loan_view(loan_row: dict, read_only: bool):
             uploaded = st.file_uploader("Upload new CSV", type=["csv"], disabled=read_only)
             if uploaded is not None and not read_only:
                 try:
-                    tmp = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+                    tmp = pd.read_csv(uploaded, engine="pyarrow", dtype_backend="pyarrow")
                     cols_lower = [c.lower().strip() for c in tmp.columns]
                     if "date" in cols_lower and "amount" in cols_lower:
                         tmp = tmp.rename(columns={tmp.columns[cols_lower.index("date")]: "payment_date",
@@ -404,8 +592,8 @@ def _common_loan_view(loan_row: dict, read_only: bool):
                     else:
                         st.error("CSV must include Date + Amount (or Payment Date + Amount)."); tmp = None
                     if tmp is not None:
-                        cleaned = clean_payments_df(tmp); replace_payments(loan_id, cleaned)
-                        st.success(f"Imported {len(cleaned)} payments (replaced)."); payments_df = payments_for_loan(loan_id)
+                        cleaned = clean_payments_df(tmp); payments_df = replace_payments(loan_id, cleaned)
+                        st.success(f"Imported {len(cleaned)} payments (replaced).")
                 except Exception as e:
                     st.error(f"CSV parse failed: {e}")
 
@@ -420,17 +608,16 @@ def _common_loan_view(loan_row: dict, read_only: bool):
                 if parsed_date is None or new_amount <= 0:
                     st.error("Enter a valid date (MM/DD/YYYY) and amount > 0.")
                 else:
-                    add = payments_df.copy()
-                    add = pd.concat([add, pd.DataFrame([{"payment_date": parsed_date, "amount": new_amount}])], ignore_index=True)
-                    add = clean_payments_df(add); replace_payments(loan_id, add)
-                    st.success("Payment added."); payments_df = payments_for_loan(loan_id)
+                    new_row = pd.DataFrame({"payment_date": [pd.Timestamp(parsed_date)], "amount": [float(new_amount)]})
+                    payments_df = append_payment(loan_id, new_row, payments_df)
+                    st.success("Payment added.")
 
     label = loan_row.get('loan_name') or loan_row.get('name') or 'Loan'
     st.subheader(f"Ledger — {label} — ACT/365")
 
     ledger = compute_ledger(
         principal=float(loan_row.get("principal") or 0.0),
-        origination_date=pd.to_datetime(loan_row.get("origination_date")).date() if loan_row.get("origination_date") else date.today(),
+        origination_date=loan_origination_date(loan_row),
         annual_rate_decimal=float(loan_row.get("annual_rate") or 0.0) / 100.0,
         payments_df=payments_df,
         grace_days=int(loan_row.get("late_fee_days") or 4),
@@ -471,51 +658,95 @@ def _common_loan_view(loan_row: dict, read_only: bool):
 
     st.divider()
     a, b = st.columns(2)
+    base = (loan_row.get('loan_name') or loan_row.get('name') or 'loan').replace(' ', '_')
     with a:
-        base = (loan_row.get('loan_name') or loan_row.get('name') or 'loan').replace(' ', '_')
-        st.download_button("⬇️ Download Ledger CSV", data=ledger.to_csv(index=False).encode("utf-8"),
+        st.download_button("⬇️ Download Ledger CSV", data=_ledger_csv_bytes(ledger),
                            file_name=f"ledger_{base}_{date.today().isoformat()}.csv", mime="text/csv")
     with b:
         pdf_bytes = build_pdf_from_ledger(ledger, loan_row)
-        base = (loan_row.get('loan_name') or loan_row.get('name') or 'loan').replace(' ', '_')
         st.download_button("📄 Download PDF Statement", data=pdf_bytes,
                            file_name=f"statement_{base}_{date.today().isoformat()}.pdf", mime="application/pdf")
 
 # ---------------- Entry ----------------
+# signed-in view by "role is borrower"; the token link is dispatched before any auth
+_SIGNED_IN_VIEWS = {True: borrower_view_signed_in, False: lender_view}
+
+@st.fragment
+def _signed_in_sidebar():
+    # fragment: clicks here rerun only this block; sign-out then escalates to a full app rerun
+    # (fragments can't open st.sidebar themselves, so the caller wraps this in it)
+    st.success(f"✅ Signed in as: {st.session_state['_user_display']}")
+    if st.button("🚪 Sign out", key="signout_main"):
+        request_sign_out(); st.rerun(scope="app")
+
 def main():
     _inject_global_css()
     if not SUPABASE_OK:
         st.error("⚠️ Supabase connection failed. Check secrets configuration."); st.stop()
 
+    if st.session_state.pop("_pending_signout", False):
+        sign_out()
+
     qp = dict(st.query_params)
-    if "access_token" in qp or "refresh_token" in qp:
+    token, role_hint = parse_query(qp)
+    is_borrower = role_hint == "borrower"
+
+    # shareable borrower links are read-only and need no auth: skip all session I/O
+    if is_borrower and token:
+        borrower_view_by_token(token); st.stop()
+
+    # each redirect's token pair is exchanged at most once per browser session,
+    # even if the params linger in the URL
+    processed = st.session_state.setdefault("_oauth_processed_tokens", set())
+    tok_fp = hash(qp.get("access_token", "") + qp.get("refresh_token", ""))
+    if ("access_token" in qp or "refresh_token" in qp) and tok_fp not in processed:
+        processed.add(tok_fp)
         st.info("🔄 Processing authentication...")
         try:
+            if not _JWT_SHAPE_RE.match(qp.get("access_token", "")):
+                raise ValueError("malformed access token")
+            prev = None
             if "session" in st.session_state:
+                prev = st.session_state["session"]
                 del st.session_state["session"]
-            ensure_session_in_state(); st.rerun()
-        except Exception as e:
+            st.session_state.pop("_user_display", None)
+            expires_in = qp.get("expires_in", "")
+            ensure_session_in_state(qp.get("access_token"), qp.get("refresh_token"),
+                                    int(expires_in) if expires_in.isdigit() else 3600)
+            new = st.session_state["session"] if "session" in st.session_state else None
+            st.session_state.pop("_auth_attempts", None)
+            # tokens are consumed; drop them so later reruns skip this branch
+            for k in _AUTH_REDIRECT_PARAMS:
+                st.query_params.pop(k, None)
+            if new is not None and (prev is None or new.access_token != prev.access_token):
+                st.rerun()
+        except (AuthRetryableError, httpx.TransportError) as e:
+            # transient network failure: un-mark the tokens (still in the URL) so the next rerun
+            # -- the button below, any interaction, or a reload -- tries again; never sleep here
+            attempts = (st.session_state["_auth_attempts"] if "_auth_attempts" in st.session_state else 0) + 1
+            st.session_state["_auth_attempts"] = attempts
+            if attempts < _AUTH_MAX_ATTEMPTS:
+                processed.discard(tok_fp)
+                st.warning(f"Couldn't reach the auth server: {e}")
+                st.button("🔄 Retry sign-in"); st.stop()
+            # out of attempts: the tokens stay marked as processed and leave the URL
+            st.session_state.pop("_auth_attempts", None)
+            for k in _AUTH_REDIRECT_PARAMS:
+                st.query_params.pop(k, None)
+            st.error(f"Auth processing failed: {e}")
+        except (AuthError, ValueError, IndexError) as e:
+            # ValueError covers binascii.Error from decoding a malformed JWT
             st.error(f"Auth processing failed: {e}")
 
     ensure_session_in_state()
-    session = st.session_state.get("session")
-    token = borrower_token_from_query()
-    role_hint = role_from_query()
-
-    if role_hint == "borrower" and token:
-        borrower_view_by_token(token); return
+    session = st.session_state["session"] if "session" in st.session_state else None
 
     if session and session.user:
         uid = session.user.id
         with st.sidebar:
-            st.success(f"✅ Signed in as: {session.user.email or uid}")
-            if st.button("🚪 Sign out", key="signout_main"):
-                sign_out(); st.rerun()
-        if role_hint == "borrower":
-            borrower_view_signed_in(uid)
-        else:
-            lender_view(uid)
-        return
+            _signed_in_sidebar()
+        _SIGNED_IN_VIEWS[is_borrower](uid)
+        st.stop()
 
     landing()
 
@@ -8,27 +8,72 @@ import streamlit as st
 st.set_page_config(page_title="Shylock — Private Loan Servicing", page_icon="💸", layout="wide")
 
 from io import BytesIO
-from datetime import date, timedelta
+import json
+import re
+from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 import secrets
 import base64
 from pathlib import Path as _Path
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the ledger loop runs as plain Python without it
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
 
 # ---------------------------
 # Supabase client
 # ---------------------------
+@st.cache_resource
+def _http_transport():
+    # one keep-alive pool per server process, shared by every PostgREST session
+    import httpx
+    return httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=10, max_connections=20, keepalive_expiry=60.0),
+    )
+
+def _pooled_postgrest_client(rest_url, headers, schema, timeout):
+    from postgrest import SyncPostgrestClient
+    from postgrest.utils import SyncClient
+
+    class _PooledPostgrestClient(SyncPostgrestClient):
+        def create_session(self, base_url, headers, timeout, verify=True):
+            return SyncClient(base_url=base_url, headers=headers, timeout=timeout,
+                              follow_redirects=True, transport=_http_transport())
+
+    return _PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout)
+
+def get_supabase(url: str, key: str):
+    # one client per browser session, reused across its reruns. Sign-in state lives on the client
+    # (its auth storage, and the JWT it sends to PostgREST), so a process-wide client would share
+    # one user's session with everyone; and create_client's default ClientOptions carries a single
+    # SyncMemoryStorage shared by every client it builds, so each session gets its own storage.
+    # Only the HTTP transport underneath is process-wide.
+    if "_supabase_client" not in st.session_state:
+        from supabase import ClientOptions, create_client
+        from gotrue import SyncMemoryStorage
+        client = create_client(url, key, ClientOptions(storage=SyncMemoryStorage()))
+        # supabase-py rebuilds the PostgREST client on auth events; route every rebuild through the pool
+        client._init_postgrest_client = _pooled_postgrest_client
+        st.session_state["_supabase_client"] = client
+    return st.session_state["_supabase_client"]
+
 try:
-    from supabase import create_client, Client
+    from supabase import Client
+    from postgrest.exceptions import APIError
     _sb = st.secrets.get("supabase", {})
     SUPABASE_URL = _sb.get("url")
     SUPABASE_ANON_KEY = _sb.get("anon_key")
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise RuntimeError("Missing supabase.url or supabase.anon_key in Streamlit secrets.")
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    supabase: Client = get_supabase(SUPABASE_URL, SUPABASE_ANON_KEY)
     SUPABASE_OK = True
 except Exception as e:
     SUPABASE_OK = False
@@ -86,19 +131,24 @@ def set_role_in_url(role: str):
 # ---------------------------
 # Responsive Header (wordmark + embedded logo + tagline)
 # ---------------------------
+@st.cache_resource(show_spinner=False)
+def _logo_b64(logo_path: str) -> str:
+    # read + encode the logo once per process, not on every header render
+    p = _Path(logo_path)
+    if not p.exists():
+        return ""
+    try:
+        return base64.b64encode(p.read_bytes()).decode("utf-8")
+    except Exception:
+        return ""
+
 def render_header(
     logo_path: str = "ShylockLogo.png",
     tagline: str = "The humane way to track private personal loans.",
     shylock_color: str = "#00B050",  # green from dollar signs
     online_color: str = "#E32636",   # red from IOU tiles
 ):
-    logo_b64 = ""
-    p = _Path(logo_path)
-    if p.exists():
-        try:
-            logo_b64 = base64.b64encode(p.read_bytes()).decode("utf-8")
-        except Exception:
-            logo_b64 = ""
+    logo_b64 = _logo_b64(logo_path)
 
     st.markdown(
         f"""
@@ -183,6 +233,7 @@ def render_header(
 # ---------------------------
 # DB access (current schema friendly)
 # ---------------------------
+@st.cache_data(ttl=60, show_spinner=False)
 def loans_for_lender(user_id: str) -> list[dict]:
     try:
         data = supabase.table("loans").select("*").eq("lender_id", user_id).order("created_at").execute().data
@@ -190,6 +241,7 @@ def loans_for_lender(user_id: str) -> list[dict]:
     except Exception:
         return []
 
+@st.cache_data(ttl=60, show_spinner=False)
 def loans_for_borrower_by_token(token: str) -> list[dict]:
     if not token:
         return []
@@ -202,7 +254,6 @@ def loans_for_borrower_by_token(token: str) -> list[dict]:
 def loans_for_borrower_signed_in(user_id: str) -> list[dict]:
     """Optional join table loan_borrowers(user_id, loan_id). If absent, return []."""
     try:
-        supabase.table("loan_borrowers").select("loan_id").limit(1).execute()
         lb = supabase.table("loan_borrowers").select("loan_id").eq("user_id", user_id).execute().data or []
         loan_ids = [r["loan_id"] for r in lb]
         if not loan_ids:
@@ -212,6 +263,7 @@ def loans_for_borrower_signed_in(user_id: str) -> list[dict]:
     except Exception:
         return []
 
+@st.cache_data(ttl=60, show_spinner=False)
 def payments_for_loan(loan_id: str) -> pd.DataFrame:
     try:
         rows = supabase.table("payments").select("*").eq("loan_id", loan_id).order("payment_date").execute().data or []
@@ -224,33 +276,72 @@ def payments_for_loan(loan_id: str) -> pd.DataFrame:
     df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
     return df[["payment_date", "amount"]].dropna()
 
+def _clear_loan_caches():
+    loans_for_lender.clear(); loans_for_borrower_by_token.clear()
+
 def upsert_loan(loan: dict):
-    return supabase.table("loans").upsert(loan, on_conflict="id").execute()
+    res = supabase.table("loans").upsert(loan, on_conflict="id").execute()
+    _clear_loan_caches()
+    return res
 
 def delete_loan(loan_id: str):
-    return supabase.table("loans").delete().eq("id", loan_id).execute()
+    res = supabase.table("loans").delete().eq("id", loan_id).execute()
+    _clear_loan_caches()
+    return res
+
+_INSERT_BATCH = 500  # keeps each PostgREST request body bounded for large CSV imports
+_RPC_MISSING_CODES = ("PGRST202", "42883")  # PostgREST / Postgres "function does not exist"
 
 def replace_payments(loan_id: str, df: pd.DataFrame):
-    supabase.table("payments").delete().eq("loan_id", loan_id).execute()
-    if df is None or df.empty:
-        return
-    payload = []
-    for _, r in df.iterrows():
-        try:
-            dt = pd.to_datetime(r["payment_date"]).date().isoformat()
-            amt = float(r["amount"])
-            if amt <= 0:
-                continue
-            payload.append({"loan_id": loan_id, "payment_date": dt, "amount": amt})
-        except Exception:
-            continue
-    if payload:
-        supabase.table("payments").insert(payload).execute()
+    rows = []
+    if df is not None and not df.empty:
+        # one vectorized pass instead of a Series per row; unparseable/non-positive rows are dropped
+        dates = pd.to_datetime(df["payment_date"], errors="coerce")
+        amts = pd.to_numeric(df["amount"], errors="coerce").to_numpy(dtype=float)
+        mask = dates.notna().to_numpy() & np.isfinite(amts) & (amts > 0)
+        rows = [{"payment_date": d, "amount": a}
+                for d, a in zip(dates[mask].dt.strftime("%Y-%m-%d").tolist(), amts[mask].tolist())]
+    try:
+        # one round trip, delete + insert in a single transaction (public.replace_payments in sql/migrations.sql)
+        supabase.rpc("replace_payments", {"p_loan_id": loan_id, "p_rows": rows}).execute()
+    except APIError as e:
+        # only a database without the function yet falls back (delete, then insert in bounded
+        # batches, not atomic); permission/payload/timeout errors must not double- or half-write
+        if e.code not in _RPC_MISSING_CODES:
+            raise
+        supabase.table("payments").delete().eq("loan_id", loan_id).execute()
+        payload = [{"loan_id": loan_id, **r} for r in rows]
+        for i in range(0, len(payload), _INSERT_BATCH):
+            supabase.table("payments").insert(payload[i:i + _INSERT_BATCH]).execute()
+    finally:
+        payments_for_loan.clear()
+
+def append_payment(loan_id: str, row: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    # Add Payment inserts only the new row instead of deleting and reinserting the history;
+    # returns current + row, date-sorted, so the caller can skip a re-fetch
+    dt, amt = row["payment_date"].iat[0], row["amount"].iat[0]
+    supabase.table("payments").insert({"loan_id": loan_id, "payment_date": dt.isoformat(), "amount": float(amt)}).execute()
+    payments_for_loan.clear()
+    merged = row if current.empty else pd.concat([current, row], ignore_index=True)
+    return merged.sort_values("payment_date", kind="stable").reset_index(drop=True)
 
 
 # ---------------------------
 # Data cleaning
 # ---------------------------
+_PAREN_RE = re.compile(r"^\((.*)\)$")   # (12.50) -> -12.50
+_AMT_STRIP = str.maketrans("", "", ",$\u00A0")  # literal chars: one C-level translate pass
+
+def _parse_payment_dates(col: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col.dt.date
+    # ISO dates parse on the fast fixed-format path; only the leftovers go through format inference
+    d = pd.to_datetime(col, format="%Y-%m-%d", errors="coerce")
+    miss = d.isna() & col.notna()
+    if miss.any():
+        d[miss] = pd.to_datetime(col[miss], errors="coerce")
+    return d.dt.date
+
 def clean_payments_df(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return pd.DataFrame(columns=["payment_date", "amount"])
@@ -260,14 +351,11 @@ def clean_payments_df(df: pd.DataFrame) -> pd.DataFrame:
         out = out.rename(columns={"date": "payment_date"})
     if "amount" not in out.columns:
         raise ValueError("Missing 'Amount' column")
-    out["payment_date"] = pd.to_datetime(out["payment_date"], errors="coerce").dt.date
-    amt = out["amount"].astype(str).str.strip()
-    amt = (amt
-           .str.replace(r"^\((.*)\)$", r"-\1", regex=True)
-           .str.replace(",", "", regex=False)
-           .str.replace("$", "", regex=False)
-           .str.replace("\u00A0", "", regex=False))
-    out["amount"] = pd.to_numeric(amt, errors="coerce")
+    out["payment_date"] = _parse_payment_dates(out["payment_date"])
+    if not pd.api.types.is_numeric_dtype(out["amount"]):
+        amt = out["amount"].astype(str).str.strip()
+        out["amount"] = amt.str.replace(_PAREN_RE, r"-\1", regex=True).str.translate(_AMT_STRIP)
+    out["amount"] = pd.to_numeric(out["amount"], errors="coerce").astype("float64")  # Arrow-backed CSV columns too
     out = out.dropna(subset=["payment_date", "amount"]).reset_index(drop=True)
     out = out[out["amount"] > 0]
     return out[["payment_date", "amount"]]
@@ -276,23 +364,77 @@ def clean_payments_df(df: pd.DataFrame) -> pd.DataFrame:
 # ---------------------------
 # Ledger math (ACT/365 simple) with Late Fees + Penalty Interest
 # ---------------------------
-from datetime import date as _date, timedelta as _timedelta
-
-def _dec(x) -> Decimal:
-    return Decimal(str(x)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-def _prev_due_date(orig: _date, when: _date) -> _date:
-    months = (when.year - orig.year) * 12 + (when.month - orig.month)
-    if when.day < orig.day:
-        months -= 1
-    y = orig.year + (orig.month - 1 + months) // 12
-    m = ((orig.month - 1 + months) % 12) + 1
-    if m == 12:
-        last_day = (_date(y + 1, 1, 1) - _timedelta(days=1)).day
-    else:
-        last_day = (_date(y, m + 1, 1) - _timedelta(days=1)).day
-    day = min(orig.day, last_day)
-    return _date(y, m, day)
+from datetime import date as _date
+
+def _prev_due_dates(orig: _date, when: np.ndarray) -> np.ndarray:
+    when = when.astype("datetime64[D]")
+    month = when.astype("datetime64[M]")
+    y = month.astype("datetime64[Y]").astype(np.int64) + 1970
+    m = month.astype(np.int64) % 12 + 1
+    d = (when - month.astype("datetime64[D]")).astype(np.int64) + 1
+    months = (y - orig.year) * 12 + (m - orig.month) - (d < orig.day)
+    due_month = np.datetime64(f"{orig.year:04d}-{orig.month:02d}", "M") + months
+    last_day = ((due_month + 1).astype("datetime64[D]") - due_month.astype("datetime64[D]")).astype(np.int64)
+    return due_month.astype("datetime64[D]") + np.minimum(orig.day, last_day) - 1
+
+_RATE_SCALE = 1_000_000
+_DENOM = 365 * _RATE_SCALE        # ACT/365 accrual
+_MONTH_DENOM = 12 * _RATE_SCALE   # APR/12 for percent late fees
+
+# money is int cents end to end; inputs are rounded half-up to the cent once, as written (str),
+# since round(float(x) * 100) would turn 1.005 into 100 (binary 100.4999...)
+def _cents(x) -> int:
+    return int(Decimal(str(x)).scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+
+def _rate_scaled(x) -> int:
+    return int(round(float(x) * _RATE_SCALE))
+
+@njit(cache=True)
+def _div_half_up(num: int, den: int) -> int:
+    q = (2 * abs(num) + den) // (2 * den)
+    return q if num >= 0 else -q
+
+@njit(cache=True)
+def _div_half_even(num: int, den: int) -> int:
+    q, r = divmod(abs(num), den)
+    if 2 * r > den or (2 * r == den and q & 1):
+        q += 1
+    return q if num >= 0 else -q
+
+@njit(cache=True)
+def _run_ledger(bal0_c, apr_num, apr_pen_num, days, due_late_mask, amts_c, is_percent, late_fee_c, pct_bp):
+    n = len(amts_c)
+    out = np.empty((11, n), dtype=np.int64)
+    bal_p = bal0_c; out_late = 0; out_pen_i = 0; loan_i_carry = 0
+    for i in range(n):
+        accrued_loan_i = _div_half_up(bal_p * apr_num * days[i], _DENOM)
+        loan_i_due = accrued_loan_i + loan_i_carry
+
+        new_late_fee = 0
+        if due_late_mask[i]:
+            if is_percent:
+                new_late_fee = _div_half_even(_div_half_even(bal_p * apr_num, _MONTH_DENOM) * pct_bp, 10_000)
+            else:
+                new_late_fee = late_fee_c
+            if new_late_fee > 0:
+                out_late += new_late_fee
+
+        accrued_pen_i = _div_half_up(out_late * apr_pen_num * days[i], _DENOM)
+        out_pen_i += accrued_pen_i
+
+        remaining = amts_c[i]
+        alloc_pen_i = min(remaining, out_pen_i); remaining -= alloc_pen_i; out_pen_i -= alloc_pen_i
+        alloc_late  = min(remaining, out_late);  remaining -= alloc_late;  out_late  -= alloc_late
+        alloc_loan_i = min(remaining, loan_i_due); remaining -= alloc_loan_i; loan_i_due -= alloc_loan_i
+        alloc_prin  = remaining; bal_p -= alloc_prin
+        loan_i_carry = loan_i_due
+
+        out[0, i] = alloc_pen_i + alloc_late + alloc_loan_i + alloc_prin
+        out[1, i] = accrued_loan_i + loan_i_carry
+        out[2, i] = accrued_pen_i; out[3, i] = new_late_fee
+        out[4, i] = alloc_pen_i; out[5, i] = alloc_late; out[6, i] = alloc_loan_i; out[7, i] = alloc_prin
+        out[8, i] = bal_p; out[9, i] = out_late; out[10, i] = out_pen_i
+    return out
 
 def compute_ledger(
     principal: float,
@@ -308,85 +450,63 @@ def compute_ledger(
     df = clean_payments_df(payments_df)
     df = df[df["payment_date"] >= origination_date].sort_values("payment_date").reset_index(drop=True)
 
-    bal_p = _dec(principal)
-    out_late = _dec(0)
-    out_pen_i = _dec(0)
-    loan_i_carry = _dec(0)
-    last_event_date = origination_date
-
-    apr_p = Decimal(str(annual_rate_decimal))
-    apr_pen = Decimal(str(penalty_apr_decimal if penalty_apr_decimal not in (None, 0) else annual_rate_decimal))
-
-    rows = []
-
-    for _, r in df.iterrows():
-        pay_dt = r["payment_date"]
-        pay_amt = _dec(r["amount"])
-        due_dt = _prev_due_date(origination_date, pay_dt)
-
-        # 1) Loan interest accrual since last event
-        days_loan = max((pay_dt - last_event_date).days, 0)
-        accrued_loan_i = (bal_p * apr_p * Decimal(days_loan) / Decimal(365)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        loan_i_due = (accrued_loan_i + loan_i_carry).quantize(Decimal("0.01"))
-
-        # 2) Assess late fee
-        new_late_fee = _dec(0)
-        if late_fee_days is not None and late_fee_days >= 0:
-            if pay_dt > (due_dt + timedelta(days=int(late_fee_days))):
-                if late_fee_type == "percent":
-                    ref = (bal_p * apr_p / Decimal(12)).quantize(Decimal("0.01"))
-                    new_late_fee = (ref * Decimal(late_fee_amount) / Decimal(100)).quantize(Decimal("0.01"))
-                else:
-                    new_late_fee = _dec(late_fee_amount)
-                if new_late_fee > 0:
-                    out_late = (out_late + new_late_fee).quantize(Decimal("0.01"))
-
-        # 3) Penalty interest accrual on outstanding late fees
-        days_pen = max((pay_dt - last_event_date).days, 0)
-        accrued_pen_i = (out_late * apr_pen * Decimal(days_pen) / Decimal(365)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        out_pen_i = (out_pen_i + accrued_pen_i).quantize(Decimal("0.01"))
-
-        # 4) Allocation order
-        remaining = pay_amt
-        alloc_pen_i = min(remaining, out_pen_i); remaining -= alloc_pen_i; out_pen_i -= alloc_pen_i
-        alloc_late  = min(remaining, out_late);  remaining -= alloc_late;  out_late  -= alloc_late
-        alloc_loan_i = min(remaining, loan_i_due); remaining -= alloc_loan_i; loan_i_due -= alloc_loan_i
-        alloc_prin  = remaining; remaining = _dec(0); bal_p = (bal_p - alloc_prin).quantize(Decimal("0.01"))
-        loan_i_carry = loan_i_due
-
-        rows.append({
-            "Payment Date": pay_dt,
-            "Due Date": due_dt,
-            "Payment Amount": (alloc_pen_i + alloc_late + alloc_loan_i + alloc_prin),
-            "Accrued Loan Interest": (accrued_loan_i + loan_i_carry),
-            "Penalty Interest Accrued": accrued_pen_i,
-            "Late Fee (Assessed)": new_late_fee,
-            "Allocated → Penalty Interest": alloc_pen_i,
-            "Allocated → Late Fees": alloc_late,
-            "Allocated → Loan Interest": alloc_loan_i,
-            "Allocated → Principal": alloc_prin,
-            "Principal Balance (End)": bal_p,
-            "Late Fees Outstanding (End)": out_late,
-            "Penalty Interest Outstanding (End)": out_pen_i
-        })
-
-        last_event_date = pay_dt
-
-    return pd.DataFrame(rows)
+    # Vector prep: int64 cents, day counts and late mask for every payment at once
+    dates = df["payment_date"].to_numpy().astype("datetime64[D]")
+    due = _prev_due_dates(origination_date, dates)
+    days = np.maximum(np.diff(dates, prepend=np.datetime64(origination_date, "D")).astype(np.int64), 0)
+    amts_c = np.fromiter(map(_cents, df["amount"].tolist()), np.int64, len(df))  # half-up, like the baseline
+    if late_fee_days is not None and late_fee_days >= 0:
+        late = dates > due + np.timedelta64(int(late_fee_days), "D")
+    else:
+        late = np.zeros(len(df), dtype=bool)
+
+    apr = _rate_scaled(annual_rate_decimal)
+    apr_pen = _rate_scaled(penalty_apr_decimal if penalty_apr_decimal not in (None, 0) else annual_rate_decimal)
+    pct_bp = int(round(float(late_fee_amount) * 100)) if late_fee_type == "percent" else 0
+    fixed_fee = _cents(late_fee_amount)
+
+    out = _run_ledger(_cents(principal), apr, apr_pen, days, late, amts_c,
+                      late_fee_type == "percent", fixed_fee, pct_bp)
+
+    money = out / 100.0
+    return pd.DataFrame({
+        "Payment Date": df["payment_date"].to_numpy(),
+        "Due Date": pd.Series(due, dtype="datetime64[ns]").dt.date.to_numpy(),
+        "Payment Amount": money[0],
+        "Accrued Loan Interest": money[1],
+        "Penalty Interest Accrued": money[2],
+        "Late Fee (Assessed)": money[3],
+        "Allocated → Penalty Interest": money[4],
+        "Allocated → Late Fees": money[5],
+        "Allocated → Loan Interest": money[6],
+        "Allocated → Principal": money[7],
+        "Principal Balance (End)": money[8],
+        "Late Fees Outstanding (End)": money[9],
+        "Penalty Interest Outstanding (End)": money[10],
+    })
 
 
 # ---------------------------
-# PDF Builder (Matplotlib)
+# PDF Builder (ReportLab)
 # ---------------------------
 def build_pdf_from_ledger(ledger: pd.DataFrame, loan_meta: dict) -> bytes:
+    # reportlab is only needed when a PDF is requested; keep it off the cold-start path
+    from xml.sax.saxutils import escape
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
     buf = BytesIO()
-    pp = PdfPages(buf)
+    doc = SimpleDocTemplate(buf, pagesize=letter, leftMargin=0.4 * inch, rightMargin=0.4 * inch,
+                            topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+    styles = getSampleStyleSheet()
+    body = ParagraphStyle("body", parent=styles["Normal"], fontSize=11, leading=15)
+    mono = ParagraphStyle("mono", parent=styles["Code"], fontSize=10, leading=13)
+    head = ParagraphStyle("head", parent=styles["Normal"], fontName="Helvetica-Bold", fontSize=6.5, leading=7.5)
 
     # --- Summary page ---
-    fig = plt.figure(figsize=(8.5, 11))
-    fig.clf()
-    plt.axis('off')
-
     loan_label = loan_meta.get('loan_name') or loan_meta.get('name') or 'Loan'
     title = "Loan Statement"
     subtitle = f"{loan_label} — Generated {date.today():%b %d, %Y}"
@@ -433,24 +553,12 @@ def build_pdf_from_ledger(ledger: pd.DataFrame, loan_meta: dict) -> bytes:
         "Disclaimer: This statement is informational only. Lender is responsible for any required legal disclosures.",
     ]
 
-    y = 0.95
-    for s in lines:
-        plt.text(0.05, y, s, ha='left', va='top', fontsize=11, family='sans-serif', weight='bold' if s == title else 'normal')
-        y -= 0.035
-    y -= 0.01
-    for s in summary_lines:
-        plt.text(0.05, y, s, ha='left', va='top', fontsize=10, family='monospace')
-        y -= 0.028
-
-    pp.savefig(fig, bbox_inches='tight')
-    plt.close(fig)
+    story = [Paragraph(escape(s), styles["Title"] if s == title else body) if s else Spacer(1, 8) for s in lines]
+    story += [Paragraph(escape(s.replace("→", "->")), mono) if s else Spacer(1, 8) for s in summary_lines]
 
     # --- Ledger pages ---
+    # one platypus Table; it splits across pages itself and repeats the header row
     if not ledger.empty:
-        dfp = ledger.copy()
-        dfp["Payment Date"] = pd.to_datetime(dfp["Payment Date"]).dt.strftime("%Y-%m-%d")
-        dfp["Due Date"] = pd.to_datetime(dfp["Due Date"]).dt.strftime("%Y-%m-%d")
-
         cols = [
             "Payment Date", "Due Date", "Payment Amount",
             "Penalty Interest Accrued", "Late Fee (Assessed)",
@@ -458,23 +566,22 @@ def build_pdf_from_ledger(ledger: pd.DataFrame, loan_meta: dict) -> bytes:
             "Allocated → Loan Interest", "Allocated → Principal",
             "Principal Balance (End)", "Late Fees Outstanding (End)", "Penalty Interest Outstanding (End)"
         ]
-
-        rows_per_page = 24
-        for start in range(0, len(dfp), rows_per_page):
-            chunk = dfp.iloc[start:start + rows_per_page][cols]
-            fig = plt.figure(figsize=(8.5, 11))
-            ax = fig.add_subplot(111)
-            ax.axis('off')
-            ax.set_title("Payment & Accrual Activity", fontsize=12, pad=16)
-            tbl = ax.table(cellText=chunk.values, colLabels=chunk.columns, loc='center')
-            tbl.auto_set_font_size(False)
-            tbl.set_fontsize(7.5)
-            tbl.scale(1, 1.2)
-            pp.savefig(fig, bbox_inches='tight')
-            plt.close(fig)
-
-    pp.close()
-    buf.seek(0)
+        dates = [[f"{d:%Y-%m-%d}" for d in ledger[c]] for c in cols[:2]]
+        money = [[f"{v:,.2f}" for v in ledger[c].to_numpy(dtype=float)] for c in cols[2:]]
+        header = [Paragraph(escape(c.replace("→", "to")), head) for c in cols]
+        tbl = Table([header] + [list(r) for r in zip(*dates, *money)], repeatRows=1,
+                    colWidths=[doc.width / len(cols)] * len(cols))
+        tbl.setStyle(TableStyle([
+            ("FONT", (0, 1), (-1, -1), "Helvetica", 7),
+            ("LEFTPADDING", (0, 0), (-1, -1), 2), ("RIGHTPADDING", (0, 0), (-1, -1), 2),
+            ("ALIGN", (2, 1), (-1, -1), "RIGHT"),
+            ("VALIGN", (0, 0), (-1, 0), "BOTTOM"),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
+        ]))
+        story += [PageBreak(), Paragraph("Payment &amp; Accrual Activity", styles["Heading3"]), tbl]
+
+    doc.build(story)
     return buf.getvalue()
 
 
@@ -570,8 +677,8 @@ def borrower_view_signed_in(user_id: str):
     if not rows:
         st.info("No loans are shared with this account.")
         return
-    names = [f"{(r.get('loan_name') or r.get('name') or 'Loan')} — {r['id'][:8]}" for r in rows]
-    idx = st.selectbox("Select loan", range(len(rows)), format_func=lambda i: names[i])
+    labels = [f"{(r.get('loan_name') or r.get('name') or 'Loan')} — {r['id'][:8]}" for r in rows]
+    idx = st.selectbox("Select loan", range(len(rows)), format_func=labels.__getitem__)
     loan = rows[idx]
     _common_loan_view(loan, read_only=True)
 
@@ -616,6 +723,7 @@ def lender_view(user_id: str):
                 st.error(f"Create loan failed: {e}")
     with t2:
         if st.button("🔄 Refresh"):
+            _clear_loan_caches(); payments_for_loan.clear()
             st.rerun()
     with t3:
         if st.button("🚪 Sign out"):
@@ -626,11 +734,8 @@ def lender_view(user_id: str):
         st.info("No loans yet. Click **New Loan** to create one.")
         return
 
-    sel = st.selectbox(
-        "Select Loan",
-        options=range(len(loans)),
-        format_func=lambda i: f"{(loans[i].get('loan_name') or loans[i].get('name') or 'Loan')} — {loans[i].get('borrower_name','(Borrower?)')} — {loans[i]['id'][:8]}"
-    )
+    labels = [f"{(l.get('loan_name') or l.get('name') or 'Loan')} — {l.get('borrower_name','(Borrower?)')} — {l['id'][:8]}" for l in loans]
+    sel = st.selectbox("Select Loan", options=range(len(loans)), format_func=labels.__getitem__)
     loan = loans[sel]
 
     with st.sidebar:
@@ -691,6 +796,18 @@ def lender_view(user_id: str):
 # ---------------------------
 # Shared loan view (payments + ledger + exports)
 # ---------------------------
+_PDF_META_KEYS = ("loan_name", "name", "lender_name", "borrower_name", "origination_date", "annual_rate", "principal",
+                  "late_fee_type", "late_fee_amount", "late_fee_days", "penalty_interest_rate")
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _ledger_csv_bytes(ledger: pd.DataFrame) -> bytes:
+    # keyed on the ledger's content hash: reruns with an unchanged ledger skip to_csv
+    return ledger.to_csv(index=False).encode("utf-8")
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=600)  # statements carry today's date
+def _statement_pdf_bytes(ledger: pd.DataFrame, loan_meta_json: str) -> bytes:
+    return build_pdf_from_ledger(ledger, json.loads(loan_meta_json))
+
 def _common_loan_view(loan_row: dict, read_only: bool):
     loan_id = loan_row["id"]
     payments_df = payments_for_loan(loan_id)
@@ -701,7 +818,8 @@ def _common_loan_view(loan_row: dict, read_only: bool):
     uploaded = st.file_uploader("Upload payments CSV (optional)", type=["csv"], disabled=read_only)
     if uploaded is not None and not read_only:
         try:
-            tmp = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+            # columnar parse; clean_payments_df takes the typed Arrow columns as they come
+            tmp = pd.read_csv(uploaded, engine="pyarrow", dtype_backend="pyarrow")
             cols_lower = [c.lower().strip() for c in tmp.columns]
             if "date" in cols_lower and "amount" in cols_lower:
                 tmp = tmp.rename(columns={tmp.columns[cols_lower.index("date")]: "payment_date",
@@ -717,7 +835,7 @@ def _common_loan_view(loan_row: dict, read_only: bool):
                 cleaned = clean_payments_df(tmp)
                 replace_payments(loan_id, cleaned)
                 st.success(f"Imported {len(cleaned)} payments.")
-                payments_df = payments_for_loan(loan_id)
+                payments_df = cleaned  # already what was written; no need to re-read
         except Exception as e:
             st.error(f"CSV parse failed: {e}")
 
@@ -730,12 +848,9 @@ def _common_loan_view(loan_row: dict, read_only: bool):
             new_amount = st.number_input("Amount ($)", min_value=0.01, value=100.00, step=10.0, format="%.2f", key=f"new_amt_{loan_id}")
         with c3:
             if st.button("Add Payment", key=f"addpay_{loan_id}"):
-                add = payments_df.copy()
-                add = pd.concat([add, pd.DataFrame([{"payment_date": new_date, "amount": new_amount}])], ignore_index=True)
-                add = clean_payments_df(add)
-                replace_payments(loan_id, add)
+                new_row = clean_payments_df(pd.DataFrame([{"payment_date": new_date, "amount": new_amount}]))
+                payments_df = append_payment(loan_id, new_row, payments_df)
                 st.success("Payment added.")
-                payments_df = payments_for_loan(loan_id)
 
     label = loan_row.get('loan_name') or loan_row.get('name') or 'Loan'
     st.subheader(f"Ledger — {label} (Late Fees + Penalty Interest) — ACT/365")
@@ -783,21 +898,19 @@ def _common_loan_view(loan_row: dict, read_only: bool):
         c4.metric("Days Since Last Payment", (date.today() - last_pay).days)
 
     st.divider()
+    # render both buttons directly: nesting a download_button under st.button needs a second click
+    base = (loan_row.get('loan_name') or loan_row.get('name') or 'loan').replace(' ', '_')
+    meta = {k: loan_row[k] for k in _PDF_META_KEYS if k in loan_row}
     c1, c2 = st.columns(2)
     with c1:
-        if st.button("⬇️ Download CSV"):
-            csv_bytes = ledger.to_csv(index=False).encode("utf-8")
-            base = (loan_row.get('loan_name') or loan_row.get('name') or 'loan').replace(' ', '_')
-            st.download_button("Download Ledger CSV", data=csv_bytes,
-                               file_name=f"ledger_{base}_{date.today().isoformat()}.csv",
-                               mime="text/csv")
+        st.download_button("⬇️ Download Ledger CSV", data=_ledger_csv_bytes(ledger),
+                           file_name=f"ledger_{base}_{date.today().isoformat()}.csv",
+                           mime="text/csv")
     with c2:
-        if st.button("📄 Generate PDF"):
-            pdf_bytes = build_pdf_from_ledger(ledger, loan_row)
-            base = (loan_row.get('loan_name') or loan_row.get('name') or 'loan').replace(' ', '_')
-            st.download_button("Download PDF Statement", data=pdf_bytes,
-                               file_name=f"statement_{base}_{date.today().isoformat()}.pdf",
-                               mime="application/pdf")
+        st.download_button("📄 Download PDF Statement",
+                           data=_statement_pdf_bytes(ledger, json.dumps(meta, sort_keys=True, default=str)),
+                           file_name=f"statement_{base}_{date.today().isoformat()}.pdf",
+                           mime="application/pdf")
 
 
 # ---------------------------
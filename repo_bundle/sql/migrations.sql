@@ -31,3 +31,19 @@ begin
     alter table public.payments add constraint payments_amount_positive check (amount > 0);
   end if;
 end$$;
+
+-- replace a loan's payments atomically in one round trip (called by loan_app.replace_payments)
+create or replace function public.replace_payments(p_loan_id uuid, p_rows jsonb)
+returns void
+language sql
+as $$
+  delete from public.payments where loan_id = p_loan_id;
+  insert into public.payments (loan_id, payment_date, amount)
+  select p_loan_id, (x->>'payment_date')::date, (x->>'amount')::numeric
+  from jsonb_array_elements(p_rows) as x;
+$$;
+
+-- indexes for the app's access patterns
+create index if not exists payments_loan_date_idx on public.payments (loan_id, payment_date) include (amount);
+create index if not exists loans_lender_created_idx on public.loans (lender_id, created_at);
+create unique index if not exists loans_borrower_token_idx on public.loans (borrower_token);
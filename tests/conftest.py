@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the apps are plain scripts next to each other, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,170 @@
+"""The bundle app's int64-cents penalty-interest ledger against its original Decimal engine."""
+import importlib.util
+import random
+import sys
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BUNDLE_APP = Path(__file__).resolve().parents[1] / "repo_bundle" / "app" / "loan_app.py"
+
+
+@pytest.fixture(scope="module")
+def bundle(tmp_path_factory):
+    # the bundle is a single Streamlit script; without Supabase secrets it imports with
+    # SUPABASE_OK = False and main() stays behind its __main__ guard
+    spec = importlib.util.spec_from_file_location("bundle_loan_app", BUNDLE_APP)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = mod
+    try:
+        from numba.core import config as numba_config
+    except ImportError:
+        numba_config = None
+    if numba_config is not None:
+        # numba's cache=True files sit next to the source and record the loading module's name;
+        # compile into a private dir so the app (run as __main__) never picks up this module's cache
+        saved_dir, numba_config.CACHE_DIR = numba_config.CACHE_DIR, str(tmp_path_factory.mktemp("numba_cache"))
+    try:
+        spec.loader.exec_module(mod)
+    finally:
+        if numba_config is not None:
+            numba_config.CACHE_DIR = saved_dir
+    yield mod
+    sys.modules.pop(spec.name, None)
+
+
+# ---------------- reference: the Decimal loop compute_ledger replaced ----------------
+def _dec(x) -> Decimal:
+    return Decimal(str(x)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def _prev_due_date(orig: date, when: date) -> date:
+    months = (when.year - orig.year) * 12 + (when.month - orig.month) - (when.day < orig.day)
+    y, m = orig.year + (orig.month - 1 + months) // 12, (orig.month - 1 + months) % 12 + 1
+    last_day = ((date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)) - timedelta(days=1)).day
+    return date(y, m, min(orig.day, last_day))
+
+def reference_ledger(clean, principal, origination_date, annual_rate_decimal, payments_df, *,
+                     late_fee_type="fixed", late_fee_amount=0.0, late_fee_days=0, penalty_apr_decimal=None):
+    df = clean(payments_df)
+    df = df[df["payment_date"] >= origination_date].sort_values("payment_date").reset_index(drop=True)
+    bal_p, out_late, out_pen_i, loan_i_carry = _dec(principal), _dec(0), _dec(0), _dec(0)
+    last_event_date = origination_date
+    apr_p = Decimal(str(annual_rate_decimal))
+    apr_pen = Decimal(str(penalty_apr_decimal if penalty_apr_decimal not in (None, 0) else annual_rate_decimal))
+    rows = []
+    for pay_dt, amount in zip(df["payment_date"], df["amount"]):
+        pay_amt, due_dt = _dec(amount), _prev_due_date(origination_date, pay_dt)
+        days = max((pay_dt - last_event_date).days, 0)
+        accrued_loan_i = (bal_p * apr_p * Decimal(days) / Decimal(365)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        loan_i_due = (accrued_loan_i + loan_i_carry).quantize(Decimal("0.01"))
+        new_late_fee = _dec(0)
+        if late_fee_days is not None and late_fee_days >= 0 and pay_dt > due_dt + timedelta(days=int(late_fee_days)):
+            if late_fee_type == "percent":
+                ref = (bal_p * apr_p / Decimal(12)).quantize(Decimal("0.01"))
+                new_late_fee = (ref * Decimal(late_fee_amount) / Decimal(100)).quantize(Decimal("0.01"))
+            else:
+                new_late_fee = _dec(late_fee_amount)
+            if new_late_fee > 0:
+                out_late = (out_late + new_late_fee).quantize(Decimal("0.01"))
+        accrued_pen_i = (out_late * apr_pen * Decimal(days) / Decimal(365)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        out_pen_i = (out_pen_i + accrued_pen_i).quantize(Decimal("0.01"))
+        # allocation order: penalty interest, late fees, loan interest, principal
+        remaining = pay_amt
+        alloc_pen_i = min(remaining, out_pen_i); remaining -= alloc_pen_i; out_pen_i -= alloc_pen_i
+        alloc_late = min(remaining, out_late); remaining -= alloc_late; out_late -= alloc_late
+        alloc_loan_i = min(remaining, loan_i_due); remaining -= alloc_loan_i; loan_i_due -= alloc_loan_i
+        alloc_prin = remaining; bal_p = (bal_p - alloc_prin).quantize(Decimal("0.01"))
+        loan_i_carry = loan_i_due
+        rows.append({
+            "Payment Date": pay_dt, "Due Date": due_dt,
+            "Payment Amount": alloc_pen_i + alloc_late + alloc_loan_i + alloc_prin,
+            "Accrued Loan Interest": accrued_loan_i + loan_i_carry,
+            "Penalty Interest Accrued": accrued_pen_i, "Late Fee (Assessed)": new_late_fee,
+            "Allocated → Penalty Interest": alloc_pen_i, "Allocated → Late Fees": alloc_late,
+            "Allocated → Loan Interest": alloc_loan_i, "Allocated → Principal": alloc_prin,
+            "Principal Balance (End)": bal_p, "Late Fees Outstanding (End)": out_late,
+            "Penalty Interest Outstanding (End)": out_pen_i,
+        })
+        last_event_date = pay_dt
+    return pd.DataFrame(rows)
+
+
+# ---------------- helpers ----------------
+def assert_matches_reference(bundle, **kw):
+    got, ref = bundle.compute_ledger(**kw), reference_ledger(bundle.clean_payments_df, **kw)
+    assert len(got) == len(ref)
+    if ref.empty:
+        return
+    assert list(got.columns) == list(ref.columns)
+    for c in ("Payment Date", "Due Date"):
+        assert list(got[c]) == list(ref[c]), c
+    for c in ref.columns[2:]:
+        # exact to the cent: the engine works in int64 cents and only divides by 100 for display
+        np.testing.assert_array_equal(np.round(got[c].to_numpy() * 100).astype(np.int64),
+                                      (ref[c].map(Decimal) * 100).astype(np.int64).to_numpy(), err_msg=c)
+
+def _payments(dates, amounts) -> pd.DataFrame:
+    return pd.DataFrame({"payment_date": list(dates), "amount": list(amounts)})
+
+
+# ---------------- tests ----------------
+@pytest.mark.parametrize("amount", [1.005, 2.675, 416.665, 10.015, 0.125, 1234.565])
+def test_half_up_cent_boundaries(bundle, amount):
+    assert_matches_reference(bundle, principal=10000.005, origination_date=date(2024, 1, 15), annual_rate_decimal=0.0725,
+                             payments_df=_payments(["2024-02-15", "2024-03-25", "2024-04-30"], [amount, 600.0, amount]),
+                             late_fee_type="fixed", late_fee_amount=12.345, late_fee_days=5)
+
+@pytest.mark.parametrize("late_fee_type,late_fee_amount", [("fixed", 25.0), ("percent", 5.0), ("percent", 2.5)])
+@pytest.mark.parametrize("penalty_apr", [None, 0, 0.24])
+def test_penalty_interest_on_outstanding_late_fees(bundle, late_fee_type, late_fee_amount, penalty_apr):
+    # tiny late payments leave fees outstanding, so penalty interest accrues and is allocated first
+    kw = dict(principal=15000.0, origination_date=date(2023, 3, 10), annual_rate_decimal=0.12,
+              payments_df=_payments(["2023-04-20", "2023-05-25", "2023-07-01", "2023-07-02", "2023-09-30"],
+                                    [10.0, 0.5, 3.0, 900.0, 150.0]),
+              late_fee_type=late_fee_type, late_fee_amount=late_fee_amount, late_fee_days=3,
+              penalty_apr_decimal=penalty_apr)
+    assert_matches_reference(bundle, **kw)
+    got = bundle.compute_ledger(**kw)
+    assert got["Penalty Interest Accrued"].sum() > 0 and got["Allocated → Penalty Interest"].sum() > 0
+
+def test_late_fees_disabled(bundle):
+    kw = dict(principal=5000.0, origination_date=date(2024, 1, 1), annual_rate_decimal=0.1,
+              payments_df=_payments(["2024-03-28", "2024-06-30"], [100.0, 100.0]),
+              late_fee_amount=50.0, late_fee_days=-1)
+    assert_matches_reference(bundle, **kw)
+    assert (bundle.compute_ledger(**kw)["Late Fee (Assessed)"] == 0).all()
+
+def test_month_end_due_dates(bundle):
+    kw = dict(principal=8000.0, origination_date=date(2024, 1, 31), annual_rate_decimal=0.09,
+              payments_df=_payments(["2024-02-29", "2024-03-30", "2024-04-29", "2024-05-31"], [100.0] * 4),
+              late_fee_amount=10.0, late_fee_days=0)
+    got = bundle.compute_ledger(**kw)
+    # the due date a payment falls after: clamped to the month's last day, never chained
+    assert list(got["Due Date"]) == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 5, 31)]
+    assert_matches_reference(bundle, **kw)
+
+def test_payments_before_origination_and_unparseable_rows_are_dropped(bundle):
+    kw = dict(principal=1000.0, origination_date=date(2024, 6, 1), annual_rate_decimal=0.05,
+              payments_df=_payments(["2024-05-20", "not a date", "2024-07-01", "2024-07-01"], [50.0, 20.0, "$1,000.00", "(5.00)"]))
+    got = bundle.compute_ledger(**kw)
+    assert list(got["Payment Date"]) == [date(2024, 7, 1)]
+    assert_matches_reference(bundle, **kw)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_randomized_against_reference(bundle, seed):
+    rng = random.Random(seed)
+    for _ in range(60):
+        orig = date(2020, 1, 1) + timedelta(days=rng.randint(0, 800))
+        k = rng.randint(0, 30)
+        pays = _payments([(orig + timedelta(days=rng.randint(-10, 900))).isoformat() for _ in range(k)],
+                         [rng.choice([round(rng.uniform(1, 3000), 2), round(rng.uniform(1, 3000), 3), 1.005, 2.675, 10.015])
+                          for _ in range(k)])
+        assert_matches_reference(bundle, principal=round(rng.uniform(100, 200000), 2), origination_date=orig,
+                                 annual_rate_decimal=rng.choice([0.05, 0.0725, 0.125, 0.18, 0.0]), payments_df=pays,
+                                 late_fee_type=rng.choice(["fixed", "percent"]),
+                                 late_fee_amount=rng.choice([0, 5, 25.5, 10, 2.5]), late_fee_days=rng.choice([0, 5, 10, -1]),
+                                 penalty_apr_decimal=rng.choice([None, 0, 0.24, 0.3]))
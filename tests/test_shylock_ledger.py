@@ -0,0 +1,178 @@
+"""compute_ledger / compute_ledgers_batch against the original per-row Decimal engine."""
+import random
+from calendar import monthrange
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import shylock_ledger as sl
+
+DATE_COLS = ("Due Date", "Payment Date (Posted)")
+
+
+# ---------------- reference: the Decimal loop compute_ledger replaced ----------------
+def _dec(x) -> Decimal:
+    return Decimal(str(x)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def _add_months(d: date, months: int) -> date:
+    y, m = d.year + (d.month - 1 + months) // 12, (d.month - 1 + months) % 12 + 1
+    return date(y, m, min(d.day, monthrange(y, m)[1]))
+
+def _late_fee(cycle_interest, late_fee_type, late_fee_amount):
+    if late_fee_type == "percent":
+        return (cycle_interest * Decimal(late_fee_amount) / Decimal(100)).quantize(Decimal("0.01"))
+    return _dec(late_fee_amount)
+
+def reference_ledger(principal, origination_date, annual_rate_decimal, payments_df, *,
+                     grace_days=4, late_fee_type="fixed", late_fee_amount=0.0) -> pd.DataFrame:
+    payments = []
+    if payments_df is not None and not payments_df.empty:
+        tmp = payments_df.copy()
+        tmp["payment_date"] = pd.to_datetime(tmp["payment_date"], errors="coerce").dt.date
+        tmp["amount"] = pd.to_numeric(tmp["amount"], errors="coerce")
+        tmp = tmp.dropna().sort_values("payment_date")
+        payments = tmp.groupby("payment_date", as_index=False)["amount"].sum().to_dict("records")
+
+    P, r = _dec(principal), Decimal(str(annual_rate_decimal))
+    rows, pay_idx, carry = [], 0, _dec(0)
+    last_pay_dt = payments[-1]["payment_date"] if payments else origination_date
+    max_due_dt = _add_months(origination_date, 1)
+    while max_due_dt <= _add_months(last_pay_dt if payments else origination_date, 1):
+        max_due_dt = _add_months(max_due_dt, 1)
+
+    prev_due, due = origination_date, _add_months(origination_date, 1)
+    while due <= max_due_dt:
+        cycle_interest = (P * r * Decimal((due - prev_due).days) / Decimal(365)).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        grace_dt = due + timedelta(days=int(grace_days or 0))
+        while pay_idx < len(payments) and payments[pay_idx]["payment_date"] <= due:
+            carry += _dec(payments[pay_idx]["amount"]); pay_idx += 1
+        paid_date = None
+        if carry >= cycle_interest:
+            # backtrack to the payment that pushed the pool over the cycle's interest
+            needed, t_idx, rem = cycle_interest, pay_idx - 1, carry
+            while t_idx >= 0 and payments[t_idx]["payment_date"] <= due and needed > 0:
+                amt = _dec(payments[t_idx]["amount"])
+                if rem - amt < needed:
+                    paid_date = payments[t_idx]["payment_date"]
+                rem -= amt; needed -= min(needed, amt); t_idx -= 1
+            paid_date = paid_date or due
+            carry = (carry - cycle_interest).quantize(Decimal("0.01"))
+            late_fee, days_late, principal_applied, posted = _dec(0), 0, _dec(0), cycle_interest
+        else:
+            amt_used, last_used_idx = carry, None
+            while amt_used < cycle_interest and pay_idx < len(payments):
+                amt_used += _dec(payments[pay_idx]["amount"]); last_used_idx = pay_idx; pay_idx += 1
+            if amt_used >= cycle_interest and last_used_idx is not None:
+                paid_date = payments[last_used_idx]["payment_date"]
+                days_late, late_fee = max(0, (paid_date - due).days), _dec(0)
+                if paid_date > grace_dt:
+                    late_fee = _late_fee(cycle_interest, late_fee_type, late_fee_amount)
+                    P = (P + late_fee).quantize(Decimal("0.01"))
+                extra, carry, principal_applied = amt_used - cycle_interest, _dec(0), _dec(0)
+                if extra > 0 and paid_date >= due:
+                    principal_applied = extra
+                posted = (cycle_interest + principal_applied).quantize(Decimal("0.01"))
+            else:
+                days_late = max(0, (date.today() - due).days)
+                late_fee = _late_fee(cycle_interest, late_fee_type, late_fee_amount)
+                P = (P + late_fee).quantize(Decimal("0.01"))
+                principal_applied, posted, carry = _dec(0), carry, _dec(0)
+        P = (P - principal_applied).quantize(Decimal("0.01"))
+        rows.append({"Due Date": due, "Payment Date (Posted)": paid_date, "Days Late": int(days_late),
+                     "Payment Amount (Posted)": float(posted), "Accrued Interest (Cycle)": float(cycle_interest),
+                     "Late Fee (Assessed)": float(late_fee), "Allocated → Principal": float(principal_applied),
+                     "Principal Balance (End)": float(P)})
+        prev_due, due = due, _add_months(due, 1)
+    return pd.DataFrame(rows)
+
+
+# ---------------- helpers ----------------
+def _normalized(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reset_index(drop=True).copy()
+    for c in DATE_COLS:
+        df[c] = pd.to_datetime(df[c]).astype("datetime64[ns]")
+    return df
+
+def assert_matches_reference(ledger: pd.DataFrame, **kw):
+    ref = reference_ledger(**kw)
+    pd.testing.assert_frame_equal(_normalized(ledger)[list(ref.columns)], _normalized(ref), check_dtype=False)
+
+def _payments(dates, amounts) -> pd.DataFrame:
+    return pd.DataFrame({"payment_date": list(dates), "amount": list(amounts)})
+
+def _random_loans(seed: int, n: int) -> list[dict]:
+    rng = random.Random(seed)
+    loans = []
+    for _ in range(n):
+        orig = date(2020, 1, 1) + timedelta(days=rng.randint(0, 900))
+        k = rng.choice([0, 1, 3, 10, 40])
+        pays = _payments([orig + timedelta(days=rng.randint(-20, 900)) for _ in range(k)],
+                         [rng.choice([round(rng.uniform(1, 2000), 2), round(rng.uniform(1, 2000), 3),
+                                      rng.choice([1.005, 2.675, 416.665, 0.125, 10.015])]) for _ in range(k)])
+        loans.append(dict(principal=round(rng.uniform(1000, 200000), 2), origination_date=orig,
+                          annual_rate_decimal=rng.choice([0.0, 0.05, 0.0375, 0.12125, 0.07]), payments_df=pays,
+                          grace_days=rng.choice([0, 4, 10]), late_fee_type=rng.choice(["fixed", "percent"]),
+                          late_fee_amount=rng.choice([0.0, 25.0, 5.0, 12.5])))
+    return loans
+
+
+# ---------------- tests ----------------
+@pytest.mark.parametrize("amount", [1.005, 2.675, 416.665, 10.015, 0.125, 1234.565])
+def test_half_up_cent_boundaries(amount):
+    kw = dict(principal=10000.005, origination_date=date(2024, 1, 15), annual_rate_decimal=0.0725,
+              payments_df=_payments([date(2024, 2, 15), date(2024, 3, 20), date(2024, 3, 20)], [amount, 600.0, amount]),
+              late_fee_type="fixed", late_fee_amount=12.345)
+    assert_matches_reference(sl.compute_ledger(**kw), **kw)
+
+def test_sub_cent_amounts_round_half_up():
+    assert [sl._to_cents(x) for x in (1.005, 2.675, 0.125, -1.005)] == [101, 268, 13, -101]
+
+def test_month_end_due_dates_clamp():
+    kw = dict(principal=5000.0, origination_date=date(2024, 1, 31), annual_rate_decimal=0.12,
+              payments_df=_payments([date(2024, 2, 29), date(2024, 3, 29), date(2024, 5, 2)], [50.0, 60.0, 500.0]))
+    ledger = sl.compute_ledger(**kw)
+    assert list(ledger["Due Date"].dt.date[:3]) == [date(2024, 2, 29), date(2024, 3, 29), date(2024, 4, 29)]
+    assert_matches_reference(ledger, **kw)
+
+def test_unsatisfied_cycles_post_nat():
+    kw = dict(principal=20000.0, origination_date=date(2023, 6, 10), annual_rate_decimal=0.18,
+              payments_df=_payments([date(2023, 7, 10), date(2023, 9, 1)], [400.0, 5.0]),
+              late_fee_type="percent", late_fee_amount=5.0)
+    ledger = sl.compute_ledger(**kw)
+    unpaid = ledger["Payment Date (Posted)"].isna()
+    assert unpaid.any() and (ledger.loc[unpaid, "Late Fee (Assessed)"] > 0).all()
+    assert_matches_reference(ledger, **kw)
+
+def test_no_payments():
+    kw = dict(principal=1000.0, origination_date=date(2024, 3, 31), annual_rate_decimal=0.05, payments_df=None)
+    assert_matches_reference(sl.compute_ledger(**kw), **kw)
+
+@pytest.mark.parametrize("use_polars", [True, False])
+def test_daily_payments_paths_agree(monkeypatch, use_polars):
+    if use_polars and sl.pl is None:
+        pytest.skip("polars not installed")
+    if not use_polars:
+        monkeypatch.setattr(sl, "pl", None)
+    raw = _payments([date(2024, 2, 1), date(2024, 1, 5), date(2024, 2, 1), None], [100.0, 2.675, 0.005, 50.0])
+    typed = raw.assign(payment_date=pd.to_datetime(raw["payment_date"]))
+    days, amts = sl._daily_payments(typed)
+    assert days.tolist() == np.array(["2024-01-05", "2024-02-01"], "datetime64[D]").tolist()
+    np.testing.assert_allclose(amts, [2.675, 100.005])
+    for frame in (raw, typed, raw.assign(payment_date=typed["payment_date"].dt.strftime("%Y-%m-%d"))):
+        d, a = sl._daily_payments(frame)
+        assert d.tolist() == days.tolist() and a.tolist() == amts.tolist()
+    kw = dict(principal=7500.0, origination_date=date(2023, 12, 31), annual_rate_decimal=0.09, payments_df=typed)
+    assert_matches_reference(sl.compute_ledger(**kw), **kw)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_randomized_against_reference(seed):
+    for kw in _random_loans(seed, 60):
+        assert_matches_reference(sl.compute_ledger(**kw), **kw)
+
+def test_batch_matches_reference():
+    loans = _random_loans(7, 40)
+    for kw, ledger in zip(loans, sl.compute_ledgers_batch(loans)):
+        assert_matches_reference(ledger, **kw)